@@ -1,9 +1,20 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Depends, Header, Query, Response, status, UploadFile, File
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import io
+import asyncio
+import heapq
+import random
+import csv
+import math
+import time
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
@@ -24,6 +35,11 @@ db = client[os.environ['DB_NAME']]
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
+DEFAULT_WORKSPACE_ID = 'default'
+# Per-worker token bucket so one workspace cannot starve the others; 0 disables it
+WORKSPACE_REQUESTS_PER_SECOND = float(os.environ.get('WORKSPACE_REQUESTS_PER_SECOND', '50'))
+WORKSPACE_REQUEST_BURST = float(os.environ.get('WORKSPACE_REQUEST_BURST', '100'))
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -45,6 +61,8 @@ class UserCreate(UserBase):
 class User(UserBase):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    workspace_id: str = DEFAULT_WORKSPACE_ID
+    version: int = 1
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class UserLogin(BaseModel):
@@ -70,6 +88,7 @@ class Project(ProjectBase):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     owner_id: str
+    version: int = 1
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -116,6 +135,7 @@ class TaskUpdate(BaseModel):
 class Task(TaskBase):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    version: int = 1
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -138,6 +158,7 @@ class ResourceCreate(ResourceBase):
 class Resource(ResourceBase):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    version: int = 1
 
 class ResourceAllocationBase(BaseModel):
     resource_id: str
@@ -196,6 +217,18 @@ class Relationship(RelationshipBase):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
 
+class TimelineBucket(BaseModel):
+    start: datetime
+    count: int
+
+class Timeline(BaseModel):
+    project_id: str
+    window_start: datetime
+    window_end: datetime
+    bucket: Optional[str] = None  # day, week
+    tasks: List[Task] = []
+    buckets: List[TimelineBucket] = []
+
 # ===== AUTHENTICATION HELPERS =====
 
 def hash_password(password: str) -> str:
@@ -204,16 +237,31 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
-def create_token(user_id: str, username: str, role: str) -> str:
+def create_token(user_id: str, username: str, role: str, workspace_id: str) -> str:
     expiration = datetime.now(timezone.utc) + timedelta(days=7)
     payload = {
         'user_id': user_id,
         'username': username,
         'role': role,
+        'workspace_id': workspace_id,
         'exp': expiration
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+workspace_buckets = {}  # workspace_id -> (tokens, last refill)
+
+def consume_workspace_quota(workspace_id: str):
+    if WORKSPACE_REQUESTS_PER_SECOND <= 0:
+        return
+    now = time.monotonic()
+    tokens, last = workspace_buckets.get(workspace_id, (WORKSPACE_REQUEST_BURST, now))
+    tokens = min(WORKSPACE_REQUEST_BURST, tokens + (now - last) * WORKSPACE_REQUESTS_PER_SECOND)
+    if tokens < 1:
+        workspace_buckets[workspace_id] = (tokens, now)
+        retry_after = math.ceil((1 - tokens) / WORKSPACE_REQUESTS_PER_SECOND)
+        raise HTTPException(status_code=429, detail="Workspace request quota exceeded", headers={"Retry-After": str(retry_after)})
+    workspace_buckets[workspace_id] = (tokens - 1, now)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
@@ -221,8 +269,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user_id = payload.get('user_id')
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
+        workspace_id = payload.get('workspace_id', DEFAULT_WORKSPACE_ID)
+        
+        consume_workspace_quota(workspace_id)
         
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await db.users.find_one({"id": user_id, "workspace_id": workspace_id}, {"_id": 0})
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         
@@ -235,25 +286,90 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# ===== SERIALIZATION HELPERS =====
+
+TASK_DATE_FIELDS = ['start_date', 'end_date', 'expected_completion_date', 'realized_completion_date']
+
+def parse_task_dates(task: dict) -> dict:
+    if isinstance(task.get('created_at'), str):
+        task['created_at'] = datetime.fromisoformat(task['created_at'])
+    if isinstance(task.get('updated_at'), str):
+        task['updated_at'] = datetime.fromisoformat(task['updated_at'])
+    for field in TASK_DATE_FIELDS:
+        if task.get(field) and isinstance(task[field], str):
+            task[field] = datetime.fromisoformat(task[field])
+    return task
+
+# ===== VERSIONING HELPERS =====
+
+def get_expected_version(expected_version: Optional[int] = None, if_match: Optional[str] = Header(None)) -> Optional[int]:
+    if if_match is None:
+        return expected_version
+    # "*" matches any existing document, which the update requires anyway
+    if if_match.strip() == '*':
+        return expected_version
+    try:
+        return int(if_match.removeprefix('W/').strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a document version")
+
+def version_filter(expected_version: Optional[int]) -> dict:
+    if expected_version is None:
+        return {}
+    # Documents written before versioning have no field and count as version 1
+    if expected_version == 1:
+        return {"version": {"$in": [1, None]}}
+    return {"version": expected_version}
+
+def versioned_update(fields: dict, expressions: Optional[dict] = None) -> list:
+    """Build an update pipeline that sets fields and bumps the version.
+
+    Values are wrapped in $literal so user input is never evaluated as an
+    aggregation expression; ``expressions`` are passed through unwrapped.
+    """
+    stage = {k: {"$literal": v} for k, v in fields.items()}
+    stage.update(expressions or {})
+    stage['version'] = {"$add": [{"$ifNull": ["$version", 1]}, 1]}
+    return [{"$set": stage}]
+
+def set_etag(response: Response, version: Optional[int]):
+    # Clients echo this back in If-Match to make their next update conditional
+    response.headers['ETag'] = f'"{version or 1}"'
+
+async def update_failure(collection, query: dict, entity_name: str) -> HTTPException:
+    # Only reached when the atomic update matched nothing
+    if not await collection.find_one(query, {"_id": 1}):
+        return HTTPException(status_code=404, detail=f"{entity_name} not found")
+    return HTTPException(status_code=409, detail=f"{entity_name} was modified by another request")
+
 # ===== AUTH ROUTES =====
 
-@api_router.post("/auth/register", response_model=User)
-async def register(user_data: UserCreate):
+async def insert_user(user_data: UserCreate, workspace_id: str, role: str) -> User:
     existing = await db.users.find_one({"$or": [{"username": user_data.username}, {"email": user_data.email}]}, {"_id": 0})
     if existing:
         raise HTTPException(status_code=400, detail="Username or email already exists")
     
     user_dict = user_data.model_dump()
     password = user_dict.pop('password')
-    user_obj = User(**user_dict)
+    user_dict['role'] = role
+    user_obj = User(**user_dict, workspace_id=workspace_id)
     
     doc = user_obj.model_dump()
     doc['password_hash'] = hash_password(password)
     doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.users.insert_one(doc)
+    try:
+        await db.users.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
     return user_obj
 
+@api_router.post("/auth/register", response_model=User)
+async def register(user_data: UserCreate):
+    # Self sign-up opens a new workspace owned by the registrant; joining an
+    # existing workspace goes through an admin via POST /users
+    return await insert_user(user_data, str(uuid.uuid4()), "admin")
+
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"username": credentials.username}, {"_id": 0})
@@ -264,7 +380,7 @@ async def login(credentials: UserLogin):
         user['created_at'] = datetime.fromisoformat(user['created_at'])
     
     user_obj = User(**{k: v for k, v in user.items() if k != 'password_hash'})
-    token = create_token(user_obj.id, user_obj.username, user_obj.role)
+    token = create_token(user_obj.id, user_obj.username, user_obj.role, user_obj.workspace_id)
     
     return TokenResponse(access_token=token, user=user_obj)
 
@@ -274,33 +390,54 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 # ===== USER ROUTES =====
 
+@api_router.post("/users", response_model=User)
+async def create_user(user_data: UserCreate, response: Response, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    user = await insert_user(user_data, current_user.workspace_id, user_data.role)
+    set_etag(response, user.version)
+    return user
+
 @api_router.get("/users", response_model=List[User])
 async def get_users(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    users = await db.users.find({}, {"_id": 0, "password_hash": 0}).to_list(1000)
+    users = await db.users.find({"workspace_id": current_user.workspace_id}, {"_id": 0, "password_hash": 0}).to_list(1000)
     for user in users:
         if isinstance(user['created_at'], str):
             user['created_at'] = datetime.fromisoformat(user['created_at'])
     return users
 
 @api_router.put("/users/{user_id}", response_model=User)
-async def update_user(user_id: str, user_data: UserBase, current_user: User = Depends(get_current_user)):
+async def update_user(
+    user_id: str,
+    user_data: UserBase,
+    response: Response,
+    expected_version: Optional[int] = Depends(get_expected_version),
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = await db.users.update_one(
-        {"id": user_id},
-        {"$set": user_data.model_dump()}
-    )
+    query = {"id": user_id, "workspace_id": current_user.workspace_id}
+    try:
+        updated_user = await db.users.find_one_and_update(
+            {**query, **version_filter(expected_version)},
+            versioned_update(user_data.model_dump()),
+            projection={"_id": 0, "password_hash": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
+    if not updated_user:
+        raise await update_failure(db.users, query, "User")
     
-    updated_user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
     if isinstance(updated_user['created_at'], str):
         updated_user['created_at'] = datetime.fromisoformat(updated_user['created_at'])
+    set_etag(response, updated_user.get('version'))
     return User(**updated_user)
 
 @api_router.delete("/users/{user_id}")
@@ -308,7 +445,7 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = await db.users.delete_one({"id": user_id})
+    result = await db.users.delete_one({"id": user_id, "workspace_id": current_user.workspace_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted"}
@@ -316,7 +453,7 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
 # ===== PROJECT ROUTES =====
 
 @api_router.post("/projects", response_model=Project)
-async def create_project(project_data: ProjectCreate, current_user: User = Depends(get_current_user)):
+async def create_project(project_data: ProjectCreate, response: Response, current_user: User = Depends(get_current_user)):
     project_dict = project_data.model_dump()
     project_obj = Project(**project_dict, owner_id=current_user.id)
     
@@ -327,19 +464,22 @@ async def create_project(project_data: ProjectCreate, current_user: User = Depen
         doc['start_date'] = doc['start_date'].isoformat()
     if doc['end_date']:
         doc['end_date'] = doc['end_date'].isoformat()
+    doc['workspace_id'] = current_user.workspace_id
     
     await db.projects.insert_one(doc)
+    record_change(current_user, 'project', 'create', doc)
+    set_etag(response, project_obj.version)
     return project_obj
 
 @api_router.get("/projects", response_model=List[Project])
 async def get_projects(current_user: User = Depends(get_current_user)):
     if current_user.role == "team_member":
         # Team members see only projects they're assigned to through tasks
-        tasks = await db.tasks.find({"assigned_to_user_id": current_user.id}, {"_id": 0}).to_list(1000)
+        tasks = await db.tasks.find({"workspace_id": current_user.workspace_id, "assigned_to_user_id": current_user.id}, {"_id": 0}).to_list(1000)
         project_ids = list(set([task['project_id'] for task in tasks]))
-        projects = await db.projects.find({"id": {"$in": project_ids}}, {"_id": 0}).to_list(1000)
+        projects = await db.projects.find({"workspace_id": current_user.workspace_id, "id": {"$in": project_ids}}, {"_id": 0}).to_list(1000)
     else:
-        projects = await db.projects.find({}, {"_id": 0}).to_list(1000)
+        projects = await db.projects.find({"workspace_id": current_user.workspace_id}, {"_id": 0}).to_list(1000)
     
     for project in projects:
         if isinstance(project['created_at'], str):
@@ -353,8 +493,8 @@ async def get_projects(current_user: User = Depends(get_current_user)):
     return projects
 
 @api_router.get("/projects/{project_id}", response_model=Project)
-async def get_project(project_id: str, current_user: User = Depends(get_current_user)):
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+async def get_project(project_id: str, response: Response, current_user: User = Depends(get_current_user)):
+    project = await db.projects.find_one({"id": project_id, "workspace_id": current_user.workspace_id}, {"_id": 0})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -367,10 +507,17 @@ async def get_project(project_id: str, current_user: User = Depends(get_current_
     if project.get('end_date') and isinstance(project['end_date'], str):
         project['end_date'] = datetime.fromisoformat(project['end_date'])
     
+    set_etag(response, project.get('version'))
     return Project(**project)
 
 @api_router.put("/projects/{project_id}", response_model=Project)
-async def update_project(project_id: str, project_data: ProjectCreate, current_user: User = Depends(get_current_user)):
+async def update_project(
+    project_id: str,
+    project_data: ProjectCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(get_expected_version),
+    current_user: User = Depends(get_current_user)
+):
     update_dict = project_data.model_dump()
     update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
     if update_dict.get('start_date'):
@@ -378,15 +525,19 @@ async def update_project(project_id: str, project_data: ProjectCreate, current_u
     if update_dict.get('end_date'):
         update_dict['end_date'] = update_dict['end_date'].isoformat()
     
-    result = await db.projects.update_one(
-        {"id": project_id},
-        {"$set": update_dict}
+    query = {"id": project_id, "workspace_id": current_user.workspace_id}
+    updated_project = await db.projects.find_one_and_update(
+        {**query, **version_filter(expected_version)},
+        versioned_update(update_dict),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Project not found")
+    if not updated_project:
+        raise await update_failure(db.projects, query, "Project")
+    
+    record_change(current_user, 'project', 'update', updated_project, update_dict)
     
-    updated_project = await db.projects.find_one({"id": project_id}, {"_id": 0})
     if isinstance(updated_project['created_at'], str):
         updated_project['created_at'] = datetime.fromisoformat(updated_project['created_at'])
     if isinstance(updated_project['updated_at'], str):
@@ -396,16 +547,130 @@ async def update_project(project_id: str, project_data: ProjectCreate, current_u
     if updated_project.get('end_date') and isinstance(updated_project['end_date'], str):
         updated_project['end_date'] = datetime.fromisoformat(updated_project['end_date'])
     
+    set_etag(response, updated_project.get('version'))
     return Project(**updated_project)
 
+def as_utc(value: datetime) -> datetime:
+    # Dates entered without a timezone are stored naive and treated as UTC
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def utc_bound(value: datetime) -> str:
+    # Stored dates are mostly naive ISO strings, so compare against naive UTC
+    return as_utc(value).replace(tzinfo=None).isoformat()
+
+def task_span_seconds(task: dict) -> float:
+    if not task.get('start_date') or not task.get('end_date'):
+        return 0
+    start = as_utc(datetime.fromisoformat(task['start_date']))
+    end = as_utc(datetime.fromisoformat(task['end_date']))
+    return max((end - start).total_seconds(), 0)
+
+async def track_task_spans(tasks: List[dict]):
+    """Raise each project's longest task span, which bounds timeline scans."""
+    spans = {}
+    for task in tasks:
+        span = task_span_seconds(task)
+        key = (task['workspace_id'], task['project_id'])
+        if span > spans.get(key, 0):
+            spans[key] = span
+    for (workspace_id, project_id), span in spans.items():
+        await db.projects.update_one(
+            {"id": project_id, "workspace_id": workspace_id},
+            {"$max": {"max_task_span_seconds": span}}
+        )
+
+TIMELINE_BUCKETS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+TIMELINE_MAX_BUCKETS = 1000
+
+def bucket_task_counts(spans: List[tuple], window_start: datetime, window_end: datetime, step: timedelta) -> List[TimelineBucket]:
+    """Count the tasks active in each bucket of the window.
+
+    Each span adds +1 at its first bucket and -1 after its last one, so the
+    counts come out of a single prefix sum regardless of how long tasks are.
+    """
+    n_buckets = int((window_end - window_start) / step) + 1
+    if n_buckets > TIMELINE_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail="Timeline window too large for bucket size")
+
+    deltas = [0] * (n_buckets + 1)
+    for start, end in spans:
+        first = max(int((start - window_start) / step), 0)
+        last = min(int((end - window_start) / step), n_buckets - 1)
+        if first > last:
+            continue
+        deltas[first] += 1
+        deltas[last + 1] -= 1
+
+    buckets = []
+    active = 0
+    for i in range(n_buckets):
+        active += deltas[i]
+        buckets.append(TimelineBucket(start=window_start + step * i, count=active))
+    return buckets
+
+@api_router.get("/projects/{project_id}/timeline", response_model=Timeline)
+async def get_project_timeline(
+    project_id: str,
+    window_start: datetime = Query(..., alias="from"),
+    window_end: datetime = Query(..., alias="to"),
+    bucket: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    window_start = as_utc(window_start)
+    window_end = as_utc(window_end)
+    if window_end < window_start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if bucket and bucket not in TIMELINE_BUCKETS:
+        raise HTTPException(status_code=400, detail="Bucket must be 'day' or 'week'")
+
+    project = await db.projects.find_one(
+        {"id": project_id, "workspace_id": current_user.workspace_id},
+        {"_id": 0, "max_task_span_seconds": 1}
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # No task is longer than the project's longest span, so an overlapping task
+    # must start within [from - span, to]; that range is what the
+    # (workspace_id, project_id, start_date, end_date) index scans.
+    earliest_start = window_start - timedelta(seconds=project.get('max_task_span_seconds', 0))
+    query = {
+        'workspace_id': current_user.workspace_id,
+        'project_id': project_id,
+        'start_date': {'$gte': utc_bound(earliest_start), '$lte': utc_bound(window_end)},
+        'end_date': {'$gte': utc_bound(window_start)}
+    }
+    if current_user.role == "team_member":
+        query['assigned_to_user_id'] = current_user.id
+
+    timeline = Timeline(project_id=project_id, window_start=window_start, window_end=window_end, bucket=bucket)
+
+    if bucket:
+        spans = []
+        async for task in db.tasks.find(query, {"_id": 0, "start_date": 1, "end_date": 1}):
+            spans.append((
+                as_utc(datetime.fromisoformat(task['start_date'])),
+                as_utc(datetime.fromisoformat(task['end_date']))
+            ))
+        timeline.buckets = bucket_task_counts(spans, window_start, window_end, TIMELINE_BUCKETS[bucket])
+        return timeline
+
+    tasks = await db.tasks.find(query, {"_id": 0}).sort("start_date", 1).to_list(None)
+    timeline.tasks = [Task(**parse_task_dates(task)) for task in tasks]
+    return timeline
+
 @api_router.delete("/projects/{project_id}")
 async def delete_project(project_id: str, current_user: User = Depends(get_current_user)):
     if current_user.role == "team_member":
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    result = await db.projects.delete_one({"id": project_id})
-    if result.deleted_count == 0:
+    deleted = await db.projects.find_one_and_delete(
+        {"id": project_id, "workspace_id": current_user.workspace_id},
+        projection={"_id": 0, "id": 1, "version": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Project not found")
+    record_change(current_user, 'project', 'delete', deleted)
     return {"message": "Project deleted"}
 
 # ===== BASELINE ROUTES =====
@@ -423,13 +688,14 @@ async def create_project_baseline(baseline_data: BaselineBase, project_id: str,
     
     doc = baseline_obj.model_dump()
     doc['frozen_date'] = doc['frozen_date'].isoformat()
+    doc['workspace_id'] = current_user.workspace_id
     
     await db.project_baselines.insert_one(doc)
     return baseline_obj
 
 @api_router.get("/baselines/project/{project_id}", response_model=List[ProjectBaseline])
 async def get_project_baselines(project_id: str, current_user: User = Depends(get_current_user)):
-    baselines = await db.project_baselines.find({"project_id": project_id}, {"_id": 0}).to_list(1000)
+    baselines = await db.project_baselines.find({"workspace_id": current_user.workspace_id, "project_id": project_id}, {"_id": 0}).to_list(1000)
     for baseline in baselines:
         if isinstance(baseline['frozen_date'], str):
             baseline['frozen_date'] = datetime.fromisoformat(baseline['frozen_date'])
@@ -448,20 +714,25 @@ async def create_task_baseline(baseline_data: BaselineBase, task_id: str, curren
     
     doc = baseline_obj.model_dump()
     doc['frozen_date'] = doc['frozen_date'].isoformat()
+    doc['workspace_id'] = current_user.workspace_id
     
     await db.task_baselines.insert_one(doc)
     
     # Mark task as frozen
-    await db.tasks.update_one(
-        {"id": task_id},
-        {"$set": {"is_frozen": True}}
+    frozen_task = await db.tasks.find_one_and_update(
+        {"id": task_id, "workspace_id": current_user.workspace_id},
+        versioned_update({"is_frozen": True}),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
+    if frozen_task:
+        record_change(current_user, 'task', 'update', frozen_task, {"is_frozen": True})
     
     return baseline_obj
 
 @api_router.get("/baselines/task/{task_id}", response_model=List[TaskBaseline])
 async def get_task_baselines(task_id: str, current_user: User = Depends(get_current_user)):
-    baselines = await db.task_baselines.find({"task_id": task_id}, {"_id": 0}).to_list(1000)
+    baselines = await db.task_baselines.find({"workspace_id": current_user.workspace_id, "task_id": task_id}, {"_id": 0}).to_list(1000)
     for baseline in baselines:
         if isinstance(baseline['frozen_date'], str):
             baseline['frozen_date'] = datetime.fromisoformat(baseline['frozen_date'])
@@ -470,7 +741,7 @@ async def get_task_baselines(task_id: str, current_user: User = Depends(get_curr
 # ===== TASK ROUTES =====
 
 @api_router.post("/tasks", response_model=Task)
-async def create_task(task_data: TaskCreate, current_user: User = Depends(get_current_user)):
+async def create_task(task_data: TaskCreate, response: Response, current_user: User = Depends(get_current_user)):
     task_dict = task_data.model_dump()
     task_obj = Task(**task_dict)
     
@@ -485,13 +756,24 @@ async def create_task(task_data: TaskCreate, current_user: User = Depends(get_cu
         doc['expected_completion_date'] = doc['expected_completion_date'].isoformat()
     if doc.get('realized_completion_date'):
         doc['realized_completion_date'] = doc['realized_completion_date'].isoformat()
+    doc['workspace_id'] = current_user.workspace_id
     
     await db.tasks.insert_one(doc)
+    await track_task_spans([doc])
+    schedule_deadline(doc)
+    record_change(current_user, 'task', 'create', doc)
+    set_etag(response, task_obj.version)
     return task_obj
 
 @api_router.get("/tasks", response_model=List[Task])
-async def get_tasks(project_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
-    query = {}
+async def get_tasks(project_id: Optional[str] = None, as_of: Optional[datetime] = None, current_user: User = Depends(get_current_user)):
+    if as_of:
+        tasks = await entities_as_of(current_user.workspace_id, 'task', as_of, project_id)
+        if current_user.role == "team_member":
+            tasks = [task for task in tasks if task.get('assigned_to_user_id') == current_user.id]
+        return [Task(**parse_task_dates(task)) for task in tasks]
+    
+    query = {"workspace_id": current_user.workspace_id}
     if project_id:
         query['project_id'] = project_id
     if current_user.role == "team_member":
@@ -514,8 +796,11 @@ async def get_tasks(project_id: Optional[str] = None, current_user: User = Depen
     return tasks
 
 @api_router.get("/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: str, current_user: User = Depends(get_current_user)):
-    task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
+async def get_task(task_id: str, response: Response, as_of: Optional[datetime] = None, current_user: User = Depends(get_current_user)):
+    if as_of:
+        task = await entity_as_of(current_user.workspace_id, 'task', task_id, as_of)
+    else:
+        task = await db.tasks.find_one({"id": task_id, "workspace_id": current_user.workspace_id}, {"_id": 0})
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -532,16 +817,22 @@ async def get_task(task_id: str, current_user: User = Depends(get_current_user))
     if task.get('realized_completion_date') and isinstance(task['realized_completion_date'], str):
         task['realized_completion_date'] = datetime.fromisoformat(task['realized_completion_date'])
     
+    # A past version is not something an update can be made conditional on
+    if not as_of:
+        set_etag(response, task.get('version'))
     return Task(**task)
 
 @api_router.put("/tasks/{task_id}", response_model=Task)
-async def update_task(task_id: str, task_data: TaskUpdate, current_user: User = Depends(get_current_user)):
-    task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    if task.get('is_frozen') and current_user.role == "team_member":
-        raise HTTPException(status_code=403, detail="Cannot edit frozen task")
+async def update_task(
+    task_id: str,
+    task_data: TaskUpdate,
+    response: Response,
+    expected_version: Optional[int] = Depends(get_expected_version),
+    current_user: User = Depends(get_current_user)
+):
+    query = {"id": task_id, "workspace_id": current_user.workspace_id, **version_filter(expected_version)}
+    if current_user.role == "team_member":
+        query['is_frozen'] = {"$ne": True}
     
     update_dict = {k: v for k, v in task_data.model_dump(exclude_unset=True).items() if v is not None}
     update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
@@ -556,71 +847,91 @@ async def update_task(task_id: str, task_data: TaskUpdate, current_user: User =
         update_dict['realized_completion_date'] = update_dict['realized_completion_date'].isoformat()
     
     # Auto-set realized_completion_date when task is marked as completed
-    if update_dict.get('status') == 'completed' and not task.get('realized_completion_date'):
-        update_dict['realized_completion_date'] = datetime.now(timezone.utc).isoformat()
+    expressions = {}
+    if update_dict.get('status') == 'completed' and 'realized_completion_date' not in update_dict:
+        expressions['realized_completion_date'] = {
+            "$ifNull": ["$realized_completion_date", datetime.now(timezone.utc).isoformat()]
+        }
     
-    result = await db.tasks.update_one(
-        {"id": task_id},
-        {"$set": update_dict}
+    updated_task = await db.tasks.find_one_and_update(
+        query,
+        versioned_update(update_dict, expressions),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    updated_task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
-    if isinstance(updated_task['created_at'], str):
-        updated_task['created_at'] = datetime.fromisoformat(updated_task['created_at'])
-    if isinstance(updated_task['updated_at'], str):
-        updated_task['updated_at'] = datetime.fromisoformat(updated_task['updated_at'])
-    if updated_task.get('start_date') and isinstance(updated_task['start_date'], str):
-        updated_task['start_date'] = datetime.fromisoformat(updated_task['start_date'])
-    if updated_task.get('end_date') and isinstance(updated_task['end_date'], str):
-        updated_task['end_date'] = datetime.fromisoformat(updated_task['end_date'])
-    if updated_task.get('expected_completion_date') and isinstance(updated_task['expected_completion_date'], str):
-        updated_task['expected_completion_date'] = datetime.fromisoformat(updated_task['expected_completion_date'])
-    if updated_task.get('realized_completion_date') and isinstance(updated_task['realized_completion_date'], str):
-        updated_task['realized_completion_date'] = datetime.fromisoformat(updated_task['realized_completion_date'])
-    
-    return Task(**updated_task)
+    if not updated_task:
+        task = await db.tasks.find_one({"id": task_id, "workspace_id": current_user.workspace_id}, {"_id": 0, "is_frozen": 1})
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task.get('is_frozen') and current_user.role == "team_member":
+            raise HTTPException(status_code=403, detail="Cannot edit frozen task")
+        raise HTTPException(status_code=409, detail="Task was modified by another request")
+    
+    if 'start_date' in update_dict or 'end_date' in update_dict:
+        await track_task_spans([updated_task])
+    schedule_deadline(updated_task)
+    record_change(current_user, 'task', 'update', updated_task, {**update_dict, **expressions})
+    set_etag(response, updated_task.get('version'))
+    return Task(**parse_task_dates(updated_task))
 
 @api_router.delete("/tasks/{task_id}")
 async def delete_task(task_id: str, current_user: User = Depends(get_current_user)):
     if current_user.role == "team_member":
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    result = await db.tasks.delete_one({"id": task_id})
-    if result.deleted_count == 0:
+    deleted = await db.tasks.find_one_and_delete(
+        {"id": task_id, "workspace_id": current_user.workspace_id},
+        projection={"_id": 0, "id": 1, "project_id": 1, "version": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Task not found")
+    unschedule_deadline(task_id)
+    record_change(current_user, 'task', 'delete', deleted)
     return {"message": "Task deleted"}
 
 # ===== RESOURCE ROUTES =====
 
 @api_router.post("/resources", response_model=Resource)
-async def create_resource(resource_data: ResourceCreate, current_user: User = Depends(get_current_user)):
+async def create_resource(resource_data: ResourceCreate, response: Response, current_user: User = Depends(get_current_user)):
     if current_user.role == "team_member":
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     resource_obj = Resource(**resource_data.model_dump())
     doc = resource_obj.model_dump()
+    doc['workspace_id'] = current_user.workspace_id
     await db.resources.insert_one(doc)
+    set_etag(response, resource_obj.version)
     return resource_obj
 
 @api_router.get("/resources", response_model=List[Resource])
 async def get_resources(current_user: User = Depends(get_current_user)):
-    resources = await db.resources.find({}, {"_id": 0}).to_list(1000)
+    resources = await db.resources.find({"workspace_id": current_user.workspace_id}, {"_id": 0}).to_list(1000)
     return resources
 
 @api_router.put("/resources/{resource_id}", response_model=Resource)
-async def update_resource(resource_id: str, resource_data: ResourceCreate, current_user: User = Depends(get_current_user)):
+async def update_resource(
+    resource_id: str,
+    resource_data: ResourceCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(get_expected_version),
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role == "team_member":
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    result = await db.resources.update_one(
-        {"id": resource_id},
-        {"$set": resource_data.model_dump()}
+    query = {"id": resource_id, "workspace_id": current_user.workspace_id}
+    updated_resource = await db.resources.find_one_and_update(
+        {**query, **version_filter(expected_version)},
+        versioned_update(resource_data.model_dump()),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Resource not found")
+    if not updated_resource:
+        raise await update_failure(db.resources, query, "Resource")
     
-    updated_resource = await db.resources.find_one({"id": resource_id}, {"_id": 0})
+    set_etag(response, updated_resource.get('version'))
     return Resource(**updated_resource)
 
 @api_router.delete("/resources/{resource_id}")
@@ -628,7 +939,7 @@ async def delete_resource(resource_id: str, current_user: User = Depends(get_cur
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = await db.resources.delete_one({"id": resource_id})
+    result = await db.resources.delete_one({"id": resource_id, "workspace_id": current_user.workspace_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Resource not found")
     return {"message": "Resource deleted"}
@@ -640,16 +951,24 @@ async def create_allocation(allocation_data: ResourceAllocationCreate, current_u
     if current_user.role == "team_member":
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
+    resource = await db.resources.find_one(
+        {"id": allocation_data.resource_id, "workspace_id": current_user.workspace_id},
+        {"_id": 1}
+    )
+    if not resource:
+        raise HTTPException(status_code=404, detail="Resource not found")
+    
     allocation_obj = ResourceAllocation(**allocation_data.model_dump())
     doc = allocation_obj.model_dump()
     doc['allocation_date'] = doc['allocation_date'].isoformat()
+    doc['workspace_id'] = current_user.workspace_id
     
     await db.resource_allocations.insert_one(doc)
     return allocation_obj
 
 @api_router.get("/allocations", response_model=List[ResourceAllocation])
 async def get_allocations(project_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
-    query = {}
+    query = {"workspace_id": current_user.workspace_id}
     if project_id:
         query['project_id'] = project_id
     
@@ -669,13 +988,14 @@ async def create_cost(cost_data: CostCreate, current_user: User = Depends(get_cu
     cost_obj = Cost(**cost_data.model_dump())
     doc = cost_obj.model_dump()
     doc['date'] = doc['date'].isoformat()
+    doc['workspace_id'] = current_user.workspace_id
     
     await db.costs.insert_one(doc)
     return cost_obj
 
 @api_router.get("/costs", response_model=List[Cost])
 async def get_costs(project_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
-    query = {}
+    query = {"workspace_id": current_user.workspace_id}
     if project_id:
         query['project_id'] = project_id
     
@@ -690,7 +1010,7 @@ async def delete_cost(cost_id: str, current_user: User = Depends(get_current_use
     if current_user.role == "team_member":
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    result = await db.costs.delete_one({"id": cost_id})
+    result = await db.costs.delete_one({"id": cost_id, "workspace_id": current_user.workspace_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Cost not found")
     return {"message": "Cost deleted"}
@@ -702,13 +1022,14 @@ async def create_document(doc_data: DocumentCreate, current_user: User = Depends
     doc_obj = Document(**doc_data.model_dump())
     doc = doc_obj.model_dump()
     doc['upload_date'] = doc['upload_date'].isoformat()
+    doc['workspace_id'] = current_user.workspace_id
     
     await db.documents.insert_one(doc)
     return doc_obj
 
 @api_router.get("/documents", response_model=List[Document])
 async def get_documents(project_id: Optional[str] = None, category: Optional[str] = None, current_user: User = Depends(get_current_user)):
-    query = {}
+    query = {"workspace_id": current_user.workspace_id}
     if project_id:
         query['project_id'] = project_id
     if category:
@@ -722,7 +1043,7 @@ async def get_documents(project_id: Optional[str] = None, category: Optional[str
 
 @api_router.delete("/documents/{document_id}")
 async def delete_document(document_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.documents.delete_one({"id": document_id})
+    result = await db.documents.delete_one({"id": document_id, "workspace_id": current_user.workspace_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Document not found")
     return {"message": "Document deleted"}
@@ -733,12 +1054,13 @@ async def delete_document(document_id: str, current_user: User = Depends(get_cur
 async def create_relationship(rel_data: RelationshipCreate, current_user: User = Depends(get_current_user)):
     rel_obj = Relationship(**rel_data.model_dump())
     doc = rel_obj.model_dump()
+    doc['workspace_id'] = current_user.workspace_id
     await db.relationships.insert_one(doc)
     return rel_obj
 
 @api_router.get("/relationships", response_model=List[Relationship])
 async def get_relationships(project_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
-    query = {}
+    query = {"workspace_id": current_user.workspace_id}
     if project_id:
         query['$or'] = [
             {"from_entity_type": "project", "from_entity_id": project_id},
@@ -753,22 +1075,176 @@ async def delete_relationship(relationship_id: str, current_user: User = Depends
     if current_user.role == "team_member":
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    result = await db.relationships.delete_one({"id": relationship_id})
+    result = await db.relationships.delete_one({"id": relationship_id, "workspace_id": current_user.workspace_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Relationship not found")
     return {"message": "Relationship deleted"}
 
+# ===== EXPORT / IMPORT ROUTES =====
+
+# entity -> (collection name, stored model, create model, datetime fields)
+TRANSFER_ENTITIES = {
+    'tasks': ('tasks', Task, TaskCreate, ['created_at', 'updated_at'] + TASK_DATE_FIELDS),
+    'costs': ('costs', Cost, CostCreate, ['date']),
+    'allocations': ('resource_allocations', ResourceAllocation, ResourceAllocationCreate, ['allocation_date']),
+}
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 100
+LIST_SEPARATOR = ';'
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+LIST_FIELDS = {'assigned_resource_ids'}
+
+def get_transfer_entity(entity: str):
+    if entity not in TRANSFER_ENTITIES:
+        raise HTTPException(status_code=404, detail="Unknown entity")
+    return TRANSFER_ENTITIES[entity]
+
+def csv_cell(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = LIST_SEPARATOR.join(str(v) for v in value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Spreadsheets would run user-entered text like "=HYPERLINK(...)" as a formula
+        return "'" + value
+    return str(value)
+
+async def stream_csv(cursor, columns: List[str]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    rows = 0
+    async for doc in cursor:
+        writer.writerow([csv_cell(doc.get(column)) for column in columns])
+        rows += 1
+        # Flush in small chunks so memory stays flat whatever the row count
+        if rows % 100 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def parse_csv_row(row: dict) -> dict:
+    data = {}
+    for key, value in row.items():
+        if key is None or value is None or value == '':
+            continue
+        if key in LIST_FIELDS:
+            data[key] = [v for v in value.split(LIST_SEPARATOR) if v]
+        else:
+            data[key] = value
+    return data
+
+def read_import_batch(reader: csv.DictReader, model, create_model, date_fields: List[str]):
+    """Read and validate up to IMPORT_BATCH_SIZE rows; returns (docs, lines, errors, finished)."""
+    docs = []
+    lines = []
+    errors = []
+    for row in reader:
+        try:
+            obj = model(**create_model(**parse_csv_row(row)).model_dump())
+        except ValueError as e:
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({"row": reader.line_num, "error": str(e)})
+            continue
+
+        doc = obj.model_dump()
+        for field in date_fields:
+            if doc.get(field):
+                doc[field] = doc[field].isoformat()
+        docs.append(doc)
+        lines.append(reader.line_num)
+        if len(docs) >= IMPORT_BATCH_SIZE:
+            return docs, lines, errors, False
+    return docs, lines, errors, True
+
+async def check_import_references(entity: str, batch: List[dict], lines: List[int], workspace_id: str):
+    """Split out rows that reference another workspace's resources; returns (docs, errors)."""
+    if entity != 'allocations' or not batch:
+        return batch, []
+    known = set(await db.resources.distinct(
+        "id",
+        {"workspace_id": workspace_id, "id": {"$in": list({doc['resource_id'] for doc in batch})}}
+    ))
+    docs = []
+    errors = []
+    for doc, line in zip(batch, lines):
+        if doc['resource_id'] in known:
+            docs.append(doc)
+        else:
+            errors.append({"row": line, "error": "Resource not found"})
+    return docs, errors
+
+async def insert_import_batch(entity: str, collection: str, batch: List[dict], current_user: User):
+    await db[collection].insert_many(batch, ordered=False)
+    if entity == 'tasks':
+        await track_task_spans(batch)
+        for doc in batch:
+            schedule_deadline(doc)
+            record_change(current_user, 'task', 'create', doc)
+
+@api_router.get("/export/{entity}")
+async def export_entity(entity: str, project_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    collection, model, _, _ = get_transfer_entity(entity)
+
+    query = {"workspace_id": current_user.workspace_id}
+    if project_id:
+        query['project_id'] = project_id
+    if entity == 'tasks' and current_user.role == "team_member":
+        query['assigned_to_user_id'] = current_user.id
+
+    cursor = db[collection].find(query, {"_id": 0}).batch_size(IMPORT_BATCH_SIZE)
+    return StreamingResponse(
+        stream_csv(cursor, list(model.model_fields)),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{entity}.csv"'}
+    )
+
+@api_router.post("/import/{entity}")
+async def import_entity(entity: str, file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+    if current_user.role == "team_member":
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+
+    collection, model, create_model, date_fields = get_transfer_entity(entity)
+
+    imported = 0
+    errors = []
+    reader = csv.DictReader(io.TextIOWrapper(file.file, encoding='utf-8-sig', newline=''))
+    while True:
+        try:
+            # Reading and validating is CPU-bound, so keep it off the event loop
+            batch, lines, batch_errors, finished = await run_in_threadpool(
+                read_import_batch, reader, model, create_model, date_fields
+            )
+        except (UnicodeDecodeError, csv.Error):
+            raise HTTPException(status_code=400, detail=f"Invalid CSV file, {imported} rows imported before the error")
+
+        batch, reference_errors = await check_import_references(entity, batch, lines, current_user.workspace_id)
+        batch_errors = sorted(batch_errors + reference_errors, key=lambda error: error['row'])
+        errors.extend(batch_errors[:IMPORT_MAX_ERRORS - len(errors)])
+        if batch:
+            for doc in batch:
+                doc['workspace_id'] = current_user.workspace_id
+            await insert_import_batch(entity, collection, batch, current_user)
+            imported += len(batch)
+        if finished:
+            break
+
+    return {"imported": imported, "errors": errors}
+
 # ===== STATS ROUTES =====
 
 @api_router.get("/stats/dashboard")
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
     if current_user.role == "team_member":
-        tasks = await db.tasks.find({"assigned_to_user_id": current_user.id}, {"_id": 0}).to_list(1000)
+        tasks = await db.tasks.find({"workspace_id": current_user.workspace_id, "assigned_to_user_id": current_user.id}, {"_id": 0}).to_list(1000)
         project_ids = list(set([task['project_id'] for task in tasks]))
-        projects = await db.projects.find({"id": {"$in": project_ids}}, {"_id": 0}).to_list(1000)
+        projects = await db.projects.find({"workspace_id": current_user.workspace_id, "id": {"$in": project_ids}}, {"_id": 0}).to_list(1000)
     else:
-        projects = await db.projects.find({}, {"_id": 0}).to_list(1000)
-        tasks = await db.tasks.find({}, {"_id": 0}).to_list(1000)
+        projects = await db.projects.find({"workspace_id": current_user.workspace_id}, {"_id": 0}).to_list(1000)
+        tasks = await db.tasks.find({"workspace_id": current_user.workspace_id}, {"_id": 0}).to_list(1000)
     
     total_projects = len(projects)
     active_projects = len([p for p in projects if p['status'] == 'active'])
@@ -783,6 +1259,698 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
         "completion_rate": round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
     }
 
+# ===== REPORT ROUTES =====
+
+REPORT_REFRESH_SECONDS = int(os.environ.get('REPORT_REFRESH_SECONDS', '300'))
+REPORT_JITTER_SECONDS = int(os.environ.get('REPORT_JITTER_SECONDS', '30'))
+REPORT_CONCURRENCY = int(os.environ.get('REPORT_CONCURRENCY', '2'))
+REPORT_LOCK_SECONDS = int(os.environ.get('REPORT_LOCK_SECONDS', '120'))
+# Only reports read within this window are kept fresh in the background
+REPORT_ACTIVE_SECONDS = int(os.environ.get('REPORT_ACTIVE_SECONDS', '86400'))
+WORKER_ID = str(uuid.uuid4())
+
+report_semaphore = asyncio.Semaphore(REPORT_CONCURRENCY)
+report_scheduler = None
+
+class Report(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    report_type: str
+    generated_at: datetime
+    data: dict
+
+# Date-only due dates (stored as naive midnight) are due at the end of that day
+# at this UTC offset; the default of -12 means the day is over everywhere
+DUE_DATE_TIMEZONE = timezone(timedelta(hours=float(os.environ.get('DUE_DATE_UTC_OFFSET_HOURS', '-12'))))
+DATE_ONLY_SUFFIX = 'T00:00:00'
+
+def parse_due_date(value: str) -> datetime:
+    due = datetime.fromisoformat(value)
+    if due.tzinfo is None and due.time() == datetime.min.time():
+        return datetime.combine(due.date() + timedelta(days=1), datetime.min.time(), tzinfo=DUE_DATE_TIMEZONE)
+    return as_utc(due)
+
+def overdue_expression(now: datetime) -> dict:
+    """Aggregation test for overdue tasks, using the same rule as parse_due_date."""
+    today = now.astimezone(DUE_DATE_TIMEZONE).date().isoformat()
+    return {"$and": [
+        {"$ne": ["$status", "completed"]},
+        {"$gt": ["$expected_completion_date", None]},
+        {"$cond": [
+            {"$regexMatch": {"input": {"$ifNull": ["$expected_completion_date", ""]}, "regex": DATE_ONLY_SUFFIX + "$"}},
+            {"$lt": ["$expected_completion_date", today]},
+            {"$lt": ["$expected_completion_date", utc_bound(now)]}
+        ]}
+    ]}
+
+async def build_project_health(workspace_id: str) -> dict:
+    now = datetime.now(timezone.utc)
+    counts = {}
+    async for row in db.tasks.aggregate([
+        {"$match": {"workspace_id": workspace_id}},
+        {"$group": {
+            "_id": "$project_id",
+            "total_tasks": {"$sum": 1},
+            "completed_tasks": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}},
+            "overdue_tasks": {"$sum": {"$cond": [overdue_expression(now), 1, 0]}}
+        }}
+    ]):
+        counts[row['_id']] = row
+    
+    projects = []
+    async for project in db.projects.find({"workspace_id": workspace_id}, {"_id": 0, "id": 1, "name": 1, "status": 1}):
+        row = counts.get(project['id'], {})
+        total = row.get('total_tasks', 0)
+        completed = row.get('completed_tasks', 0)
+        overdue = row.get('overdue_tasks', 0)
+        if total and overdue / total > 0.25:
+            health = "off_track"
+        elif overdue:
+            health = "at_risk"
+        else:
+            health = "on_track"
+        projects.append({
+            "project_id": project['id'],
+            "name": project['name'],
+            "status": project['status'],
+            "total_tasks": total,
+            "completed_tasks": completed,
+            "overdue_tasks": overdue,
+            "completion_rate": round((completed / total * 100) if total > 0 else 0, 1),
+            "health": health
+        })
+    return {"projects": projects}
+
+async def build_completion_rates(workspace_id: str) -> dict:
+    by_priority = []
+    total = completed = 0
+    async for row in db.tasks.aggregate([
+        {"$match": {"workspace_id": workspace_id}},
+        {"$group": {
+            "_id": "$priority",
+            "total_tasks": {"$sum": 1},
+            "completed_tasks": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}}
+        }},
+        {"$sort": {"_id": 1}}
+    ]):
+        total += row['total_tasks']
+        completed += row['completed_tasks']
+        by_priority.append({
+            "priority": row['_id'],
+            "total_tasks": row['total_tasks'],
+            "completed_tasks": row['completed_tasks'],
+            "completion_rate": round(row['completed_tasks'] / row['total_tasks'] * 100, 1)
+        })
+    return {
+        "total_tasks": total,
+        "completed_tasks": completed,
+        "completion_rate": round((completed / total * 100) if total > 0 else 0, 1),
+        "by_priority": by_priority
+    }
+
+async def build_budget_status(workspace_id: str) -> dict:
+    spent = {}
+    async for row in db.costs.aggregate([
+        {"$match": {"workspace_id": workspace_id}},
+        {"$group": {"_id": "$project_id", "amount": {"$sum": "$amount"}}}
+    ]):
+        spent[row['_id']] = row['amount']
+    
+    allocated = {}
+    async for row in db.resource_allocations.aggregate([
+        {"$match": {"workspace_id": workspace_id}},
+        # Matching workspace_id and id lets the (workspace_id, id) index serve the join
+        {"$lookup": {
+            "from": "resources",
+            "let": {"resource_id": "$resource_id"},
+            "pipeline": [
+                {"$match": {"workspace_id": workspace_id, "$expr": {"$eq": ["$id", "$$resource_id"]}}},
+                {"$project": {"_id": 0, "cost_per_hour": 1}}
+            ],
+            "as": "resource"
+        }},
+        {"$unwind": {"path": "$resource", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": "$project_id",
+            "amount": {"$sum": {"$multiply": ["$allocated_hours", {"$ifNull": ["$resource.cost_per_hour", 0]}]}}
+        }}
+    ]):
+        allocated[row['_id']] = row['amount']
+    
+    projects = []
+    async for project in db.projects.find({"workspace_id": workspace_id}, {"_id": 0, "id": 1, "name": 1, "budget": 1}):
+        budget = project.get('budget') or 0.0
+        project_spent = spent.get(project['id'], 0.0)
+        projects.append({
+            "project_id": project['id'],
+            "name": project['name'],
+            "budget": budget,
+            "spent": project_spent,
+            "allocated_cost": allocated.get(project['id'], 0.0),
+            "remaining": budget - project_spent,
+            "utilization": round((project_spent / budget * 100) if budget > 0 else 0, 1),
+            "over_budget": project_spent > budget
+        })
+    return {"projects": projects}
+
+async def build_workload(workspace_id: str) -> dict:
+    now = datetime.now(timezone.utc)
+    usernames = {}
+    async for user in db.users.find({"workspace_id": workspace_id}, {"_id": 0, "id": 1, "username": 1}):
+        usernames[user['id']] = user['username']
+    
+    users = []
+    async for row in db.tasks.aggregate([
+        {"$match": {"workspace_id": workspace_id, "assigned_to_user_id": {"$ne": None}, "status": {"$ne": "completed"}}},
+        {"$group": {
+            "_id": "$assigned_to_user_id",
+            "open_tasks": {"$sum": 1},
+            "in_progress_tasks": {"$sum": {"$cond": [{"$eq": ["$status", "in_progress"]}, 1, 0]}},
+            "overdue_tasks": {"$sum": {"$cond": [overdue_expression(now), 1, 0]}}
+        }},
+        {"$sort": {"open_tasks": -1}}
+    ]):
+        users.append({
+            "user_id": row['_id'],
+            "username": usernames.get(row['_id']),
+            "open_tasks": row['open_tasks'],
+            "in_progress_tasks": row['in_progress_tasks'],
+            "overdue_tasks": row['overdue_tasks']
+        })
+    return {"users": users}
+
+REPORT_BUILDERS = {
+    'project_health': build_project_health,
+    'completion_rates': build_completion_rates,
+    'budget_status': build_budget_status,
+    'workload': build_workload,
+}
+
+async def acquire_report_lock(key: str) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        # Matches only a missing or expired lock; a live lock makes the upsert collide on _id
+        await db.report_locks.find_one_and_update(
+            {"_id": key, "expires_at": {"$lt": now.isoformat()}},
+            {"$set": {"owner": WORKER_ID, "expires_at": (now + timedelta(seconds=REPORT_LOCK_SECONDS)).isoformat()}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def refresh_report(workspace_id: str, report_type: str, max_age: Optional[int] = None) -> bool:
+    """Rebuild one report snapshot, unless another worker holds its lock.
+
+    With ``max_age`` set, a snapshot younger than that many seconds is kept,
+    so workers whose scheduled runs land close together do the work once.
+    """
+    key = f"{workspace_id}:{report_type}"
+    async with report_semaphore:
+        if not await acquire_report_lock(key):
+            return False
+        try:
+            if max_age:
+                existing = await db.reports.find_one(
+                    {"workspace_id": workspace_id, "report_type": report_type},
+                    {"_id": 0, "generated_at": 1}
+                )
+                cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_age)).isoformat()
+                if existing and existing['generated_at'] > cutoff:
+                    return False
+            
+            data = await REPORT_BUILDERS[report_type](workspace_id)
+            await db.reports.update_one(
+                {"workspace_id": workspace_id, "report_type": report_type},
+                {"$set": {"generated_at": datetime.now(timezone.utc).isoformat(), "data": data}},
+                upsert=True
+            )
+            return True
+        finally:
+            await db.report_locks.delete_one({"_id": key, "owner": WORKER_ID})
+
+async def mark_reports_read(workspace_id: str, report_type: Optional[str] = None):
+    now = datetime.now(timezone.utc)
+    query = {"workspace_id": workspace_id}
+    if report_type:
+        query['report_type'] = report_type
+    # Recording at most one read per refresh interval keeps reads from becoming writes
+    await db.reports.update_many(
+        {**query, "$or": [
+            {"read_at": {"$exists": False}},
+            {"read_at": {"$lt": (now - timedelta(seconds=REPORT_REFRESH_SECONDS)).isoformat()}}
+        ]},
+        {"$set": {"read_at": now.isoformat()}}
+    )
+
+async def run_report_scheduler():
+    while True:
+        # Jitter spreads the runs of several API workers apart
+        await asyncio.sleep(random.uniform(0, REPORT_JITTER_SECONDS))
+        try:
+            # Idle workspaces are left to the on-demand rebuild in get_report
+            active_since = (datetime.now(timezone.utc) - timedelta(seconds=REPORT_ACTIVE_SECONDS)).isoformat()
+            active = await db.reports.find(
+                {"read_at": {"$gte": active_since}},
+                {"_id": 0, "workspace_id": 1, "report_type": 1}
+            ).to_list(None)
+            results = await asyncio.gather(
+                *(refresh_report(report['workspace_id'], report['report_type'], max_age=REPORT_REFRESH_SECONDS)
+                  for report in active if report['report_type'] in REPORT_BUILDERS),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Report refresh failed: %r", result)
+        except Exception:
+            logger.exception("Report scheduler run failed")
+        await asyncio.sleep(REPORT_REFRESH_SECONDS)
+
+def get_report_type(report_type: str) -> str:
+    if report_type not in REPORT_BUILDERS:
+        raise HTTPException(status_code=404, detail="Unknown report")
+    return report_type
+
+@api_router.get("/reports", response_model=List[Report])
+async def get_reports(current_user: User = Depends(get_current_user)):
+    if current_user.role == "team_member":
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    reports = await db.reports.find({"workspace_id": current_user.workspace_id}, {"_id": 0}).to_list(len(REPORT_BUILDERS))
+    await mark_reports_read(current_user.workspace_id)
+    return reports
+
+@api_router.get("/reports/{report_type}", response_model=Report)
+async def get_report(report_type: str, current_user: User = Depends(get_current_user)):
+    if current_user.role == "team_member":
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    report_type = get_report_type(report_type)
+    query = {"workspace_id": current_user.workspace_id, "report_type": report_type}
+    report = await db.reports.find_one(query, {"_id": 0})
+    # The scheduler skips idle workspaces, so their snapshots can be well past the interval
+    stale_before = (datetime.now(timezone.utc) - timedelta(seconds=2 * REPORT_REFRESH_SECONDS)).isoformat()
+    if not report or (REPORT_REFRESH_SECONDS > 0 and report['generated_at'] < stale_before):
+        # Missing or stale snapshots are rebuilt inline
+        await refresh_report(current_user.workspace_id, report_type, max_age=REPORT_REFRESH_SECONDS)
+        report = await db.reports.find_one(query, {"_id": 0}) or report
+        if not report:
+            raise HTTPException(status_code=503, detail="Report is being generated, retry shortly")
+    await mark_reports_read(current_user.workspace_id, report_type)
+    return Report(**report)
+
+@api_router.post("/reports/{report_type}/refresh", status_code=status.HTTP_202_ACCEPTED)
+async def refresh_report_now(report_type: str, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
+    if current_user.role == "team_member":
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    report_type = get_report_type(report_type)
+    background_tasks.add_task(refresh_report, current_user.workspace_id, report_type)
+    return {"message": "Report refresh scheduled"}
+
+# ===== NOTIFICATION ROUTES =====
+
+DEADLINE_HORIZON_HOURS = int(os.environ.get('DEADLINE_HORIZON_HOURS', '24'))
+DEADLINE_RELOAD_SECONDS = int(os.environ.get('DEADLINE_RELOAD_SECONDS', '60'))
+DEADLINE_LOOKBACK_DAYS = int(os.environ.get('DEADLINE_LOOKBACK_DAYS', '7'))
+DEADLINE_MAX_BACKOFF_SECONDS = 60
+
+# Min-heap of (due, task_id) plus the current due date per task. Entries are
+# invalidated lazily: a popped entry only fires if it still matches the index.
+deadline_heap = []
+deadline_index = {}  # task_id -> (workspace_id, due date as stored)
+deadline_fired = {}  # task_id -> due date this worker already notified for
+deadline_wakeup = asyncio.Event()
+deadline_engine = None
+
+class Notification(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    type: str  # task_overdue
+    task_id: str
+    project_id: str
+    message: str
+    due_date: datetime
+    read: bool = False
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+def push_deadline(task_id: str, workspace_id: str, due: str):
+    deadline_index[task_id] = (workspace_id, due)
+    entry = (parse_due_date(due), task_id)
+    heapq.heappush(deadline_heap, entry)
+    if deadline_heap[0] == entry:
+        deadline_wakeup.set()
+
+def schedule_deadline(task: dict):
+    due = task.get('expected_completion_date')
+    if isinstance(due, datetime):
+        due = due.isoformat()
+    # Deadlines past the horizon are picked up by the periodic reload instead
+    horizon = datetime.now(timezone.utc) + timedelta(hours=DEADLINE_HORIZON_HOURS)
+    if (task.get('status') == 'completed' or not due or parse_due_date(due) > horizon
+            or deadline_fired.get(task['id']) == due):
+        unschedule_deadline(task['id'])
+        return
+    push_deadline(task['id'], task['workspace_id'], due)
+
+def unschedule_deadline(task_id: str):
+    deadline_index.pop(task_id, None)
+
+async def load_deadlines(since: datetime):
+    """Merge tasks falling due between ``since`` and the horizon into the heap."""
+    global deadline_heap
+    until = datetime.now(timezone.utc) + timedelta(hours=DEADLINE_HORIZON_HOURS)
+    due_range = {"$or": [
+        {"expected_completion_date": {"$gte": utc_bound(since), "$lte": utc_bound(until)}},
+        # Date-only values fall due up to a day and a half after their stored midnight
+        {"expected_completion_date": {
+            "$gte": utc_bound(since - timedelta(days=2)),
+            "$lt": utc_bound(since),
+            "$regex": DATE_ONLY_SUFFIX + "$"
+        }}
+    ]}
+    for workspace_id in await db.users.distinct("workspace_id"):
+        async for task in db.tasks.find(
+            {"workspace_id": workspace_id, "status": {"$ne": "completed"}, **due_range},
+            {"_id": 0, "id": 1, "expected_completion_date": 1}
+        ):
+            due = task['expected_completion_date']
+            if parse_due_date(due) < since or deadline_fired.get(task['id']) == due:
+                continue
+            deadline_index[task['id']] = (workspace_id, due)
+    
+    # Deadlines before the window are never loaded again, so their fired marks can go
+    for task_id, due in list(deadline_fired.items()):
+        if parse_due_date(due) < since:
+            del deadline_fired[task_id]
+    
+    # Rebuild from the index so superseded entries do not pile up
+    deadline_heap = [(parse_due_date(due), task_id) for task_id, (_, due) in deadline_index.items()]
+    heapq.heapify(deadline_heap)
+    deadline_wakeup.set()
+
+async def notify_overdue(task_id: str, workspace_id: str, due: str):
+    # Another worker may have completed or rescheduled the task since it was queued
+    task = await db.tasks.find_one(
+        {"id": task_id, "workspace_id": workspace_id, "expected_completion_date": due, "status": {"$ne": "completed"}},
+        {"_id": 0}
+    )
+    if not task:
+        return
+    
+    user_id = task.get('assigned_to_user_id')
+    if not user_id:
+        project = await db.projects.find_one({"id": task['project_id'], "workspace_id": workspace_id}, {"_id": 0, "owner_id": 1})
+        if not project:
+            return
+        user_id = project['owner_id']
+    
+    notification = Notification(
+        user_id=user_id,
+        type="task_overdue",
+        task_id=task_id,
+        project_id=task['project_id'],
+        message=f"Task '{task['name']}' is overdue",
+        due_date=parse_due_date(due)
+    )
+    doc = notification.model_dump()
+    doc['due_date'] = due
+    doc['created_at'] = doc['created_at'].isoformat()
+    doc['workspace_id'] = workspace_id
+    key = {k: doc.pop(k) for k in ['workspace_id', 'user_id', 'type', 'task_id', 'due_date']}
+    
+    # Upsert on the natural key so every worker can fire the same deadline safely
+    await db.notifications.update_one(key, {"$setOnInsert": doc}, upsert=True)
+
+async def run_deadline_engine():
+    since = datetime.now(timezone.utc) - timedelta(days=DEADLINE_LOOKBACK_DAYS)
+    next_reload = datetime.now(timezone.utc)
+    failures = 0
+    while True:
+        try:
+            now = datetime.now(timezone.utc)
+            if now >= next_reload:
+                await load_deadlines(since)
+                # Earlier deadlines were loaded by this reload; later ones pick up what other workers changed
+                since = now
+                next_reload = now + timedelta(seconds=DEADLINE_RELOAD_SECONDS)
+            
+            while deadline_heap and deadline_heap[0][0] <= datetime.now(timezone.utc):
+                due, task_id = heapq.heappop(deadline_heap)
+                entry = deadline_index.get(task_id)
+                if not entry or parse_due_date(entry[1]) > datetime.now(timezone.utc):
+                    continue
+                try:
+                    await notify_overdue(task_id, *entry)
+                except Exception:
+                    # Keep the deadline so the retry after the backoff fires it
+                    heapq.heappush(deadline_heap, (due, task_id))
+                    raise
+                deadline_fired[task_id] = entry[1]
+                if deadline_index.get(task_id) == entry:
+                    del deadline_index[task_id]
+            failures = 0
+        except Exception:
+            failures += 1
+            logger.exception("Deadline engine run failed")
+            await asyncio.sleep(min(2 ** failures, DEADLINE_MAX_BACKOFF_SECONDS))
+            continue
+        
+        timeout = (next_reload - datetime.now(timezone.utc)).total_seconds()
+        if deadline_heap:
+            timeout = min(timeout, (deadline_heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+        deadline_wakeup.clear()
+        try:
+            await asyncio.wait_for(deadline_wakeup.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+
+@api_router.get("/notifications", response_model=List[Notification])
+async def get_notifications(unread_only: bool = False, current_user: User = Depends(get_current_user)):
+    query = {"workspace_id": current_user.workspace_id, "user_id": current_user.id}
+    if unread_only:
+        query['read'] = False
+    
+    notifications = await db.notifications.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    return notifications
+
+@api_router.put("/notifications/{notification_id}/read", response_model=Notification)
+async def mark_notification_read(notification_id: str, current_user: User = Depends(get_current_user)):
+    notification = await db.notifications.find_one_and_update(
+        {"id": notification_id, "workspace_id": current_user.workspace_id, "user_id": current_user.id},
+        {"$set": {"read": True}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return Notification(**notification)
+
+# ===== CHANGE LOG ROUTES =====
+
+CHANGE_LOG_BATCH_SIZE = int(os.environ.get('CHANGE_LOG_BATCH_SIZE', '500'))
+CHANGE_LOG_FLUSH_SECONDS = float(os.environ.get('CHANGE_LOG_FLUSH_SECONDS', '1'))
+CHANGE_LOG_CHECKPOINT_EVERY = int(os.environ.get('CHANGE_LOG_CHECKPOINT_EVERY', '20'))
+
+change_log_buffer = []
+change_log_pending = asyncio.Event()
+change_log_lock = asyncio.Lock()
+change_log_flusher = None
+
+class ChangeLogEntry(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    entity_type: str  # project, task
+    entity_id: str
+    project_id: str
+    op: str  # create, update, delete
+    version: int
+    changes: dict = {}
+    changed_by_user_id: str
+    changed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+def build_change_entry(workspace_id: str, changed_by_user_id: str, entity_type: str, op: str, doc: dict,
+                       changes: Optional[dict] = None, snapshot: bool = False) -> dict:
+    version = doc.get('version', 1)
+    if op == 'delete':
+        version += 1
+    entry = ChangeLogEntry(
+        entity_type=entity_type,
+        entity_id=doc['id'],
+        project_id=doc['project_id'] if entity_type == 'task' else doc['id'],
+        op=op,
+        version=version,
+        changes={k: doc[k] for k in (changes or {}) if k in doc},
+        changed_by_user_id=changed_by_user_id
+    )
+    
+    entry_doc = entry.model_dump()
+    entry_doc['changed_at'] = entry_doc['changed_at'].isoformat()
+    entry_doc['workspace_id'] = workspace_id
+    # The entry id doubles as _id so a retried flush cannot insert it twice
+    entry_doc['_id'] = entry_doc['id']
+    if snapshot:
+        entry_doc['snapshot'] = {k: v for k, v in doc.items() if k != '_id'}
+    return entry_doc
+
+def record_change(current_user: User, entity_type: str, op: str, doc: dict, changes: Optional[dict] = None):
+    """Queue a change-log entry for a project or task mutation.
+
+    ``doc`` is the stored document after the mutation. Only the fields that
+    were written go into ``changes``; creates, and every
+    CHANGE_LOG_CHECKPOINT_EVERY-th version, also carry a full snapshot that
+    time-travel reads start from.
+    """
+    snapshot = op == 'create' or (op == 'update' and doc.get('version', 1) % CHANGE_LOG_CHECKPOINT_EVERY == 0)
+    change_log_buffer.append(
+        build_change_entry(current_user.workspace_id, current_user.id, entity_type, op, doc, changes, snapshot)
+    )
+    if len(change_log_buffer) >= CHANGE_LOG_BATCH_SIZE:
+        change_log_pending.set()
+
+async def flush_change_log():
+    """Write the buffered entries, one flush at a time.
+
+    Entries that fail to insert go back to the front of the buffer so the next
+    flush retries them in order.
+    """
+    global change_log_buffer
+    async with change_log_lock:
+        if not change_log_buffer:
+            return
+        batch, change_log_buffer = change_log_buffer, []
+        try:
+            await db.change_log.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys are entries an earlier, partly failed flush already wrote
+            failed = [batch[error['index']] for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+            if failed or e.details.get('writeConcernErrors'):
+                change_log_buffer = (failed or batch) + change_log_buffer
+                raise
+        except BaseException:
+            # Includes cancellation, e.g. the shutdown cancelling the flusher mid-insert
+            change_log_buffer = batch + change_log_buffer
+            raise
+
+async def sync_change_log():
+    # Readers wait for this worker's in-flight and buffered entries. Entries buffered
+    # on other workers can be missing for up to CHANGE_LOG_FLUSH_SECONDS.
+    try:
+        await flush_change_log()
+    except Exception:
+        logger.exception("Change log flush failed")
+        raise HTTPException(status_code=503, detail="Change log is temporarily unavailable")
+
+async def run_change_log_flusher():
+    while True:
+        try:
+            await asyncio.wait_for(change_log_pending.wait(), CHANGE_LOG_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        change_log_pending.clear()
+        try:
+            await flush_change_log()
+        except Exception:
+            logger.exception("Change log flush failed")
+
+def as_of_bound(as_of: datetime) -> str:
+    # changed_at is stored as an aware UTC timestamp
+    return as_utc(as_of).isoformat()
+
+async def entity_as_of(workspace_id: str, entity_type: str, entity_id: str, as_of: datetime) -> Optional[dict]:
+    await sync_change_log()
+    query = {
+        "workspace_id": workspace_id,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "changed_at": {"$lte": as_of_bound(as_of)}
+    }
+    checkpoint = await db.change_log.find_one(
+        {**query, "snapshot": {"$exists": True}},
+        {"_id": 0, "version": 1, "snapshot": 1},
+        sort=[("version", -1)]
+    )
+    if not checkpoint:
+        return None
+    
+    state = checkpoint['snapshot']
+    async for entry in db.change_log.find(
+        {**query, "version": {"$gt": checkpoint['version']}},
+        {"_id": 0, "op": 1, "version": 1, "changes": 1}
+    ).sort("version", 1):
+        if entry['op'] == 'delete':
+            return None
+        state.update(entry['changes'])
+        state['version'] = entry['version']
+    return state
+
+async def entities_as_of(workspace_id: str, entity_type: str, as_of: datetime, project_id: Optional[str] = None) -> List[dict]:
+    """Rebuild every entity of a type as it stood at ``as_of``.
+
+    Each entity starts from its newest checkpoint before ``as_of``; only the
+    deltas after that checkpoint are read, so older history is never scanned.
+    """
+    await sync_change_log()
+    query = {"workspace_id": workspace_id, "entity_type": entity_type, "changed_at": {"$lte": as_of_bound(as_of)}}
+    if project_id:
+        query['project_id'] = project_id
+    
+    states = {}
+    checkpoints = []
+    async for checkpoint in db.change_log.aggregate([
+        {"$match": {**query, "snapshot": {"$exists": True}}},
+        {"$sort": {"entity_id": 1, "version": -1}},
+        {"$group": {"_id": "$entity_id", "version": {"$first": "$version"}, "snapshot": {"$first": "$snapshot"}}}
+    ]):
+        states[checkpoint['_id']] = checkpoint['snapshot']
+        checkpoints.append((checkpoint['_id'], checkpoint['version']))
+    
+    for i in range(0, len(checkpoints), CHANGE_LOG_BATCH_SIZE):
+        chunk = checkpoints[i:i + CHANGE_LOG_BATCH_SIZE]
+        async for entry in db.change_log.find(
+            {**query, "$or": [{"entity_id": entity_id, "version": {"$gt": version}} for entity_id, version in chunk]},
+            {"_id": 0, "entity_id": 1, "op": 1, "version": 1, "changes": 1}
+        ).sort([("entity_id", 1), ("version", 1)]):
+            state = states.get(entry['entity_id'])
+            if state is None:
+                continue
+            if entry['op'] == 'delete':
+                del states[entry['entity_id']]
+                continue
+            state.update(entry['changes'])
+            state['version'] = entry['version']
+    return list(states.values())
+
+@api_router.get("/changes", response_model=List[ChangeLogEntry])
+async def get_changes(
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role == "team_member":
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    await sync_change_log()
+    query = {"workspace_id": current_user.workspace_id}
+    if entity_type:
+        query['entity_type'] = entity_type
+    if entity_id:
+        query['entity_id'] = entity_id
+    if project_id:
+        query['project_id'] = project_id
+    if since or until:
+        query['changed_at'] = {}
+        if since:
+            query['changed_at']['$gte'] = as_of_bound(since)
+        if until:
+            query['changed_at']['$lte'] = as_of_bound(until)
+    
+    changes = await db.change_log.find(query, {"_id": 0, "snapshot": 0}).sort("changed_at", -1).to_list(1000)
+    return changes
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -792,6 +1960,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Configure logging
@@ -801,6 +1970,157 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+WORKSPACE_COLLECTIONS = [
+    'users', 'projects', 'project_baselines', 'tasks', 'task_baselines', 'resources',
+    'resource_allocations', 'costs', 'documents', 'relationships'
+]
+
+@app.on_event("startup")
+async def backfill_workspace_ids():
+    # Documents written before workspaces existed belong to the default workspace
+    for collection in WORKSPACE_COLLECTIONS:
+        await db[collection].update_many(
+            {"workspace_id": {"$exists": False}},
+            {"$set": {"workspace_id": DEFAULT_WORKSPACE_ID}}
+        )
+
+async def run_migration(name: str, migrate):
+    # One-off data migrations, recorded so later startups skip them
+    if await db.migrations.find_one({"_id": name}):
+        return
+    await migrate()
+    try:
+        await db.migrations.insert_one({"_id": name, "applied_at": datetime.now(timezone.utc).isoformat()})
+    except DuplicateKeyError:
+        pass  # another worker finished it first; the migrations are idempotent
+
+async def migrate_task_spans():
+    batch = []
+    async for task in db.tasks.find(
+        {"start_date": {"$ne": None}, "end_date": {"$ne": None}},
+        {"_id": 0, "workspace_id": 1, "project_id": 1, "start_date": 1, "end_date": 1}
+    ):
+        batch.append(task)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await track_task_spans(batch)
+            batch = []
+    await track_task_spans(batch)
+
+@app.on_event("startup")
+async def backfill_task_spans():
+    await run_migration("task_spans", migrate_task_spans)
+
+async def insert_change_log_checkpoints(entity_type: str, docs: List[dict]):
+    if not docs:
+        return
+    logged = set(await db.change_log.distinct(
+        "entity_id",
+        {"entity_type": entity_type, "entity_id": {"$in": [doc['id'] for doc in docs]}, "snapshot": {"$exists": True}}
+    ))
+    entries = []
+    for doc in docs:
+        if doc['id'] in logged:
+            continue
+        entry = build_change_entry(doc['workspace_id'], "system", entity_type, 'create', doc, snapshot=True)
+        # The current state is the best record of the entity since it was created
+        if isinstance(doc.get('created_at'), str):
+            entry['changed_at'] = as_of_bound(datetime.fromisoformat(doc['created_at']))
+        entry['_id'] = f"checkpoint:{entity_type}:{doc['id']}"
+        entries.append(entry)
+    if not entries:
+        return
+    try:
+        await db.change_log.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # Another worker backfilled the same entities
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+
+async def migrate_change_log():
+    for entity_type, collection in [('project', db.projects), ('task', db.tasks)]:
+        batch = []
+        async for doc in collection.find({}, {"_id": 0}):
+            batch.append(doc)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await insert_change_log_checkpoints(entity_type, batch)
+                batch = []
+        await insert_change_log_checkpoints(entity_type, batch)
+
+@app.on_event("startup")
+async def backfill_change_log():
+    # Entities created before the change log existed get a checkpoint to read from
+    await run_migration("change_log", migrate_change_log)
+
+@app.on_event("startup")
+async def create_indexes():
+    # Tenant data indexes lead with workspace_id, which also makes it a usable shard key prefix
+    for collection in WORKSPACE_COLLECTIONS:
+        await db[collection].create_index([("workspace_id", 1), ("id", 1)])
+    # Login looks users up by username alone, so it stays globally unique
+    await db.users.create_index("username", unique=True)
+    await db.tasks.create_index([("workspace_id", 1), ("project_id", 1), ("start_date", 1), ("end_date", 1)])
+    await db.tasks.create_index([("workspace_id", 1), ("assigned_to_user_id", 1)])
+    await db.project_baselines.create_index([("workspace_id", 1), ("project_id", 1)])
+    await db.task_baselines.create_index([("workspace_id", 1), ("task_id", 1)])
+    for collection in ['resource_allocations', 'costs', 'documents']:
+        await db[collection].create_index([("workspace_id", 1), ("project_id", 1)])
+    await db.reports.create_index([("workspace_id", 1), ("report_type", 1)], unique=True)
+    await db.reports.create_index("read_at")
+    await db.tasks.create_index([("workspace_id", 1), ("expected_completion_date", 1)])
+    await db.notifications.create_index([("workspace_id", 1), ("user_id", 1), ("created_at", -1)])
+    await db.notifications.create_index(
+        [("workspace_id", 1), ("user_id", 1), ("type", 1), ("task_id", 1), ("due_date", 1)],
+        unique=True
+    )
+    await db.change_log.create_index([("workspace_id", 1), ("entity_type", 1), ("entity_id", 1), ("version", 1)])
+    await db.change_log.create_index([("workspace_id", 1), ("entity_type", 1), ("project_id", 1), ("entity_id", 1), ("version", 1)])
+    await db.change_log.create_index([("workspace_id", 1), ("project_id", 1), ("changed_at", 1)])
+    await db.change_log.create_index([("workspace_id", 1), ("changed_at", 1)])
+    # Checkpoint-only indexes for finding each entity's newest snapshot
+    await db.change_log.create_index(
+        [("workspace_id", 1), ("entity_type", 1), ("entity_id", 1), ("version", -1)],
+        partialFilterExpression={"snapshot": {"$exists": True}}
+    )
+    await db.change_log.create_index(
+        [("workspace_id", 1), ("entity_type", 1), ("project_id", 1), ("entity_id", 1), ("version", -1)],
+        partialFilterExpression={"snapshot": {"$exists": True}}
+    )
+
+@app.on_event("startup")
+async def start_report_scheduler():
+    global report_scheduler
+    if REPORT_REFRESH_SECONDS > 0:
+        report_scheduler = asyncio.create_task(run_report_scheduler())
+
+@app.on_event("startup")
+async def start_deadline_engine():
+    global deadline_engine
+    if DEADLINE_RELOAD_SECONDS > 0:
+        deadline_engine = asyncio.create_task(run_deadline_engine())
+
+@app.on_event("startup")
+async def start_change_log_flusher():
+    global change_log_flusher
+    change_log_flusher = asyncio.create_task(run_change_log_flusher())
+
+@app.on_event("shutdown")
+async def stop_report_scheduler():
+    if report_scheduler:
+        report_scheduler.cancel()
+
+@app.on_event("shutdown")
+async def stop_deadline_engine():
+    if deadline_engine:
+        deadline_engine.cancel()
+
+@app.on_event("shutdown")
+async def stop_change_log_flusher():
+    if change_log_flusher:
+        change_log_flusher.cancel()
+        # Let a cancelled flush put its batch back before draining the buffer
+        await asyncio.gather(change_log_flusher, return_exceptions=True)
+    await flush_change_log()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
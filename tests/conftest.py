@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import mongomock.collection
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+# Background schedulers and rate limiting are off; tests drive them directly
+os.environ.setdefault('REPORT_REFRESH_SECONDS', '0')
+os.environ.setdefault('DEADLINE_RELOAD_SECONDS', '0')
+os.environ.setdefault('WORKSPACE_REQUESTS_PER_SECOND', '0')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+
+
+_find_and_modify = mongomock.collection.Collection._find_and_modify
+
+
+def find_and_modify(self, query, projection=None, *args, **kwargs):
+    # mongomock re-reads the updated document with the original filter unless _id is
+    # projected, so updates that change a filtered field (like version) return None
+    doc = _find_and_modify(self, query, None, *args, **kwargs)
+    if doc is None or not projection:
+        return doc
+    included = {k for k, v in projection.items() if v and k != '_id'}
+    return {
+        k: v for k, v in doc.items()
+        if projection.get(k, 1) and (not included or k in included or k == '_id')
+    }
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(mongomock.collection.Collection, '_find_and_modify', find_and_modify)
+    mongo = AsyncMongoMockClient()
+    monkeypatch.setattr(server, 'client', mongo)
+    monkeypatch.setattr(server, 'db', mongo['test_database'])
+    # Module-level state is per worker; each test gets a fresh worker
+    monkeypatch.setattr(server, 'change_log_buffer', [])
+    monkeypatch.setattr(server, 'change_log_pending', asyncio.Event())
+    monkeypatch.setattr(server, 'change_log_lock', asyncio.Lock())
+    monkeypatch.setattr(server, 'deadline_heap', [])
+    monkeypatch.setattr(server, 'deadline_index', {})
+    monkeypatch.setattr(server, 'deadline_fired', {})
+    monkeypatch.setattr(server, 'deadline_wakeup', asyncio.Event())
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def admin_headers(client):
+    body = {'username': 'admin', 'email': 'admin@example.com', 'password': 'secret', 'role': 'admin'}
+    assert client.post('/api/auth/register', json=body).status_code == 200
+    return login(client, 'admin')
+
+
+@pytest.fixture
+def member_headers(client, admin_headers):
+    body = {'username': 'member', 'email': 'member@example.com', 'password': 'secret', 'role': 'team_member'}
+    assert client.post('/api/users', json=body, headers=admin_headers).status_code == 200
+    return login(client, 'member')
+
+
+def login(client, username):
+    response = client.post('/api/auth/login', json={'username': username, 'password': 'secret'})
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockCollection
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def frequent_checkpoints(monkeypatch):
+    monkeypatch.setattr(server, 'CHANGE_LOG_CHECKPOINT_EVERY', 3)
+
+
+@pytest.fixture
+def project(client, admin_headers):
+    return client.post('/api/projects', json={'name': 'Apollo'}, headers=admin_headers).json()
+
+
+def create_task(client, headers, project, name):
+    return client.post('/api/tasks', json={'name': name, 'project_id': project['id']}, headers=headers).json()
+
+
+def workspace_id(client, headers):
+    return client.get('/api/auth/me', headers=headers).json()['workspace_id']
+
+
+def test_entity_as_of_replays_deltas_from_checkpoint(client, admin_headers, project):
+    task = create_task(client, admin_headers, project, 'v1')
+    moments = [datetime.now(timezone.utc)]
+    for version in range(2, 8):
+        client.put(f"/api/tasks/{task['id']}", json={'name': f'v{version}'}, headers=admin_headers)
+        moments.append(datetime.now(timezone.utc))
+
+    for version, moment in enumerate(moments, start=1):
+        response = client.get(f"/api/tasks/{task['id']}", params={'as_of': moment.isoformat()}, headers=admin_headers)
+        assert response.status_code == 200
+        assert (response.json()['name'], response.json()['version']) == (f'v{version}', version)
+        assert 'ETag' not in response.headers
+
+    checkpoints = client.portal.call(
+        server.db.change_log.distinct, 'version', {'entity_id': task['id'], 'snapshot': {'$exists': True}}
+    )
+    assert sorted(checkpoints) == [1, 3, 6]
+
+
+def test_entity_as_of_before_creation_is_not_found(client, admin_headers, project):
+    before = datetime.now(timezone.utc)
+    task = create_task(client, admin_headers, project, 'Design')
+
+    response = client.get(f"/api/tasks/{task['id']}", params={'as_of': before.isoformat()}, headers=admin_headers)
+
+    assert response.status_code == 404
+
+
+def test_deleted_entities_drop_out_after_delete(client, admin_headers, project):
+    kept = create_task(client, admin_headers, project, 'Kept')
+    deleted = create_task(client, admin_headers, project, 'Deleted')
+    for name in ['Deleted 2', 'Deleted 3', 'Deleted 4']:
+        client.put(f"/api/tasks/{deleted['id']}", json={'name': name}, headers=admin_headers)
+    before_delete = datetime.now(timezone.utc)
+    client.delete(f"/api/tasks/{deleted['id']}", headers=admin_headers)
+    after_delete = datetime.now(timezone.utc)
+
+    ws = workspace_id(client, admin_headers)
+    before = client.portal.call(server.entities_as_of, ws, 'task', before_delete)
+    after = client.portal.call(server.entities_as_of, ws, 'task', after_delete)
+
+    assert sorted(task['name'] for task in before) == ['Deleted 4', 'Kept']
+    assert [task['id'] for task in after] == [kept['id']]
+    assert client.portal.call(server.entity_as_of, ws, 'task', deleted['id'], after_delete) is None
+
+
+def test_entities_as_of_filters_by_project(client, admin_headers, project):
+    other = client.post('/api/projects', json={'name': 'Gemini'}, headers=admin_headers).json()
+    create_task(client, admin_headers, project, 'Design')
+    create_task(client, admin_headers, other, 'Launch')
+
+    response = client.get('/api/tasks', params={'as_of': datetime.now(timezone.utc).isoformat(), 'project_id': other['id']},
+                          headers=admin_headers)
+
+    assert [task['name'] for task in response.json()] == ['Launch']
+
+
+def test_backfill_checkpoints_entities_without_history(client):
+    client.portal.call(server.db.tasks.insert_one, {
+        'id': 'legacy', 'name': 'Legacy', 'project_id': 'p', 'workspace_id': 'w',
+        'version': 4, 'created_at': '2024-01-02T00:00:00+00:00', 'updated_at': '2024-01-02T00:00:00+00:00'
+    })
+
+    client.portal.call(server.migrate_change_log)
+    client.portal.call(server.migrate_change_log)
+
+    assert client.portal.call(server.db.change_log.count_documents, {'entity_id': 'legacy'}) == 1
+    state = client.portal.call(server.entity_as_of, 'w', 'task', 'legacy', datetime(2025, 1, 1, tzinfo=timezone.utc))
+    assert (state['name'], state['version']) == ('Legacy', 4)
+    assert client.portal.call(server.entity_as_of, 'w', 'task', 'legacy', datetime(2023, 1, 1, tzinfo=timezone.utc)) is None
+
+
+def test_failed_flush_keeps_entries(client, admin_headers, project, monkeypatch):
+    async def unavailable(self, *args, **kwargs):
+        raise ConnectionError("database unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(AsyncMongoMockCollection, 'insert_many', unavailable)
+        client.put(f"/api/projects/{project['id']}", json={'name': 'Gemini'}, headers=admin_headers)
+        response = client.get('/api/changes', headers=admin_headers)
+        assert response.status_code == 503
+
+    changes = client.get('/api/changes', params={'entity_type': 'project'}, headers=admin_headers).json()
+    assert sorted((change['op'], change['version']) for change in changes) == [('create', 1), ('update', 2)]
+    assert server.change_log_buffer == []
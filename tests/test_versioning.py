@@ -0,0 +1,109 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def project(client, admin_headers):
+    return client.post('/api/projects', json={'name': 'Apollo'}, headers=admin_headers).json()
+
+
+@pytest.fixture
+def task(client, admin_headers, project):
+    return client.post('/api/tasks', json={'name': 'Design', 'project_id': project['id']}, headers=admin_headers).json()
+
+
+def test_update_bumps_version_and_etag(client, admin_headers, project):
+    response = client.put(f"/api/projects/{project['id']}", json={'name': 'Gemini'},
+                          params={'expected_version': 1}, headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json()['version'] == 2
+    assert response.headers['ETag'] == '"2"'
+
+
+def test_stale_expected_version_conflicts(client, admin_headers, project):
+    client.put(f"/api/projects/{project['id']}", json={'name': 'Gemini'}, headers=admin_headers)
+
+    response = client.put(f"/api/projects/{project['id']}", json={'name': 'Mercury'},
+                          params={'expected_version': 1}, headers=admin_headers)
+
+    assert response.status_code == 409
+    assert client.get(f"/api/projects/{project['id']}", headers=admin_headers).json()['name'] == 'Gemini'
+
+
+def test_if_match_uses_etag(client, admin_headers, project):
+    etag = client.get(f"/api/projects/{project['id']}", headers=admin_headers).headers['ETag']
+
+    first = client.put(f"/api/projects/{project['id']}", json={'name': 'Gemini'},
+                       headers={**admin_headers, 'If-Match': etag})
+    second = client.put(f"/api/projects/{project['id']}", json={'name': 'Mercury'},
+                        headers={**admin_headers, 'If-Match': etag})
+
+    assert first.status_code == 200
+    assert second.status_code == 409
+
+
+def test_if_match_star_skips_version_check(client, admin_headers, project):
+    client.put(f"/api/projects/{project['id']}", json={'name': 'Gemini'}, headers=admin_headers)
+
+    response = client.put(f"/api/projects/{project['id']}", json={'name': 'Mercury'},
+                          headers={**admin_headers, 'If-Match': '*'})
+
+    assert response.status_code == 200
+    assert response.json()['version'] == 3
+
+
+def test_invalid_if_match_is_rejected(client, admin_headers, project):
+    response = client.put(f"/api/projects/{project['id']}", json={'name': 'Gemini'},
+                          headers={**admin_headers, 'If-Match': '"abc"'})
+
+    assert response.status_code == 400
+
+
+def test_missing_document_is_not_found(client, admin_headers):
+    response = client.put('/api/projects/missing', json={'name': 'Gemini'},
+                          params={'expected_version': 1}, headers=admin_headers)
+
+    assert response.status_code == 404
+
+
+def test_unversioned_document_counts_as_version_one(client, admin_headers, project):
+    client.portal.call(server.db.projects.update_one, {'id': project['id']}, {'$unset': {'version': ''}})
+
+    response = client.put(f"/api/projects/{project['id']}", json={'name': 'Gemini'},
+                          params={'expected_version': 1}, headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json()['version'] == 2
+
+
+def test_frozen_task_rejects_team_members(client, admin_headers, member_headers, task):
+    client.post('/api/baselines/task', params={'task_id': task['id']},
+                json={'name': 'Baseline', 'snapshot_data': {}}, headers=admin_headers)
+
+    member = client.put(f"/api/tasks/{task['id']}", json={'name': 'Build'}, headers=member_headers)
+    admin = client.put(f"/api/tasks/{task['id']}", json={'name': 'Build'}, headers=admin_headers)
+
+    assert member.status_code == 403
+    assert admin.status_code == 200
+
+
+def test_task_conflict_and_not_found(client, admin_headers, task):
+    client.put(f"/api/tasks/{task['id']}", json={'name': 'Build'}, headers=admin_headers)
+
+    stale = client.put(f"/api/tasks/{task['id']}", json={'name': 'Test'},
+                       params={'expected_version': 1}, headers=admin_headers)
+    missing = client.put('/api/tasks/missing', json={'name': 'Test'}, headers=admin_headers)
+
+    assert stale.status_code == 409
+    assert missing.status_code == 404
+
+
+def test_completion_date_is_set_once(client, admin_headers, task):
+    first = client.put(f"/api/tasks/{task['id']}", json={'status': 'completed'}, headers=admin_headers).json()
+    second = client.put(f"/api/tasks/{task['id']}", json={'status': 'completed'}, headers=admin_headers).json()
+
+    assert first['realized_completion_date'] is not None
+    assert second['realized_completion_date'] == first['realized_completion_date']
+    assert second['version'] == 3